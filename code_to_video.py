@@ -3,24 +3,118 @@
 Code to Video - Convert markdown code blocks to typing animation videos
 """
 
+import functools
+import hashlib
 import json
 import os
-import random
+import queue
 import re
+import shutil
+import subprocess
+import tempfile
+import threading
 import time
-from typing import List, Tuple, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional, NamedTuple
 
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+import pygments
 from pygments.lexers import get_lexer_by_name
+from pygments.token import Token, string_to_tokentype
 import click
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional, see the "fast" extra
+    njit = None
+
+
+# Pattern to match fenced code blocks
+_FENCE_RE = re.compile(r'```(\w+)?\n(.*?)\n```', re.DOTALL)
+
+# Characters rasterized into the glyph atlas when a generator is created
+_PRINTABLE_ASCII = [chr(code) for code in range(32, 127)]
+
+
+def _schedule_frames_numpy(delays: np.ndarray, fps: float) -> np.ndarray:
+    """
+    Count the video frames that start after each typed character
+
+    Args:
+        delays: Delay in seconds before each character
+        fps: Video frame rate
+
+    Returns:
+        Number of frames to show after each character (0 when the next
+        character is typed within the same frame)
+    """
+    # The epsilon absorbs float error at exact frame boundaries
+    frame_idx = np.floor(np.cumsum(delays) * fps + 1e-9).astype(np.int64)
+    return np.diff(frame_idx, prepend=0)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _schedule_frames(delays, fps):
+        """Compiled equivalent of _schedule_frames_numpy"""
+        counts = np.empty(len(delays), dtype=np.int64)
+        elapsed = 0.0
+        prev_frame = 0
+        for i in range(len(delays)):
+            elapsed += delays[i]
+            frame = int(np.floor(elapsed * fps + 1e-9))
+            counts[i] = frame - prev_frame
+            prev_frame = frame
+        return counts
+else:
+    _schedule_frames = _schedule_frames_numpy
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _paste_glyphs(canvas, inverse_alpha, ink, glyph_left, glyph_top, glyph_ids, xs, ys,
+                      start, end):
+        """
+        Blend the glyphs typed at positions start to end into the canvas
+
+        Glyphs are padded to one size in the stacked inverse_alpha and ink
+        arrays, the padding being fully transparent. glyph_ids is -1 where
+        nothing is drawn.
+        """
+        height, width = canvas.shape[0], canvas.shape[1]
+        glyph_h, glyph_w = ink.shape[1], ink.shape[2]
+        for pos in range(start, end):
+            glyph = glyph_ids[pos]
+            if glyph < 0:
+                continue
+
+            x0 = xs[pos] + glyph_left[glyph]
+            y0 = ys[pos] + glyph_top[glyph]
+            for gy in range(glyph_h):
+                y = y0 + gy
+                if y < 0 or y >= height:
+                    continue
+                for gx in range(glyph_w):
+                    x = x0 + gx
+                    if x < 0 or x >= width or inverse_alpha[glyph, gy, gx] == 255:
+                        continue
+
+                    # Same rounding as PIL's mask blending
+                    for c in range(3):
+                        blended = (canvas[y, x, c] * inverse_alpha[glyph, gy, gx]
+                                   + ink[glyph, gy, gx, c] + 128)
+                        canvas[y, x, c] = (blended + (blended >> 8)) >> 8
+else:
+    _paste_glyphs = None
+
 
 class TypingRealism:
     """Handles realistic typing speed variations based on keyboard ergonomics and human factors"""
     
-    def __init__(self, base_speed: float = 15.0, realistic: bool = True, randomness: float = 1.0):
+    def __init__(self, base_speed: float = 15.0, realistic: bool = True, randomness: float = 1.0,
+                 seed=None):
         """
         Initialize typing realism system
         
@@ -28,10 +122,12 @@ class TypingRealism:
             base_speed: Base characters per second
             realistic: Whether to apply keyboard ergonomics and pattern recognition
             randomness: How much random variation to apply (0.0 = none, 1.0 = normal, 2.0 = high)
+            seed: Seed for the random variation (None = unpredictable)
         """
         self.base_speed = base_speed
         self.realistic = realistic
         self.randomness = randomness
+        self._rng = np.random.default_rng(seed)
         
         # QWERTY keyboard layout with difficulty scores
         # Scores: 1.0 = home row (fastest), higher = slower
@@ -83,6 +179,30 @@ class TypingRealism:
             'TODO': 1.4, 'FIXME': 1.4, 'NOTE': 1.3,
             'console.log': 1.2, 'print(': 1.1, 'printf': 1.2,
         }
+
+        # Natural pause lengths relative to the base delay
+        self.pause_multipliers = {
+            "comma": 2.0,        # Brief pause after comma
+            "period": 3.0,       # Longer pause after sentence
+            "semicolon": 2.5,    # Programming statement end
+            "newline": 1.5,      # New line pause
+            "thinking": 4.0,     # General thinking pause
+            "brace": 1.8,        # After opening/closing braces
+        }
+
+        # Characters followed by a natural pause, checked in order
+        self.pause_chars = [
+            (',.;', "comma"),
+            ('.!?', "period"),
+            ('\n', "newline"),
+            ('{}[]()', "brace"),
+        ]
+
+        # Difficulty lookup by ASCII code for vectorized delay calculation
+        self._difficulty_lut = np.full(128, 1.5)
+        for char, difficulty in self.key_difficulty.items():
+            self._difficulty_lut[ord(char)] = difficulty
+            self._difficulty_lut[ord(char.upper())] = difficulty
     
     def get_character_delay(self, char: str, context: str = "", position: int = 0) -> float:
         """
@@ -106,18 +226,7 @@ class TypingRealism:
             char_lower = char.lower()
             difficulty = self.key_difficulty.get(char_lower, 1.5)  # Default for unknown chars
             
-            # Check for fast patterns
-            pattern_multiplier = 1.0
-            for pattern, multiplier in self.fast_patterns.items():
-                if pattern in context[max(0, position-10):position+10]:
-                    pattern_multiplier = min(pattern_multiplier, multiplier)
-                    break
-            
-            # Check for slow patterns  
-            for pattern, multiplier in self.slow_patterns.items():
-                if pattern in context[max(0, position-10):position+10]:
-                    pattern_multiplier = max(pattern_multiplier, multiplier)
-                    break
+            pattern_multiplier = self._get_pattern_multiplier(context, position)
             
             # Apply difficulty and pattern adjustments
             adjusted_delay = base_delay * difficulty * pattern_multiplier
@@ -126,13 +235,59 @@ class TypingRealism:
         if self.randomness > 0:
             # Standard deviation is proportional to randomness factor and current delay
             std_dev = adjusted_delay * 0.3 * self.randomness
-            variation = random.gauss(0, std_dev)
+            variation = std_dev * self._rng.standard_normal()
             adjusted_delay += variation
         
         # Ensure minimum delay (humans can't type infinitely fast)
         adjusted_delay = max(adjusted_delay, base_delay * 0.2)
         
         return adjusted_delay
+
+    def _get_pattern_multiplier(self, context: str, position: int) -> float:
+        """Get the speed multiplier for programming patterns around a position"""
+        window = context[max(0, position-10):position+10]
+
+        # Fastest matching fast pattern
+        pattern_multiplier = 1.0
+        for pattern, multiplier in self.fast_patterns.items():
+            if pattern in window:
+                pattern_multiplier = min(pattern_multiplier, multiplier)
+        
+        # Slowest matching slow pattern takes precedence
+        for pattern, multiplier in self.slow_patterns.items():
+            if pattern in window:
+                pattern_multiplier = max(pattern_multiplier, multiplier)
+
+        return pattern_multiplier
+
+    def precompute_multipliers(self, code: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the pattern multipliers for every position of a code block
+
+        A pattern applies to every position whose +/-10 character context
+        contains the whole match, as in get_character_delay.
+
+        Args:
+            code: Text being typed
+
+        Returns:
+            (fast_mult, slow_mult) arrays holding the fastest and slowest
+            matching multiplier per position, 1.0 where no pattern applies
+        """
+        fast_mult = np.ones(len(code))
+        slow_mult = np.ones(len(code))
+
+        # One str.find pass per pattern, marking the window around each match
+        for patterns, mult, combine in ((self.fast_patterns, fast_mult, np.minimum),
+                                        (self.slow_patterns, slow_mult, np.maximum)):
+            for pattern, multiplier in patterns.items():
+                start = code.find(pattern)
+                while start >= 0:
+                    window = slice(max(0, start + len(pattern) - 10), start + 11)
+                    mult[window] = combine(mult[window], multiplier)
+                    start = code.find(pattern, start + 1)
+
+        return fast_mult, slow_mult
     
     def get_pause_delay(self, pause_type: str = "thinking") -> float:
         """Get delay for natural pauses (end of lines, after punctuation, etc.)"""
@@ -141,26 +296,72 @@ class TypingRealism:
         
         # Apply realistic pause lengths if realism is enabled
         if self.realistic:
-            pause_multipliers = {
-                "comma": 2.0,        # Brief pause after comma
-                "period": 3.0,       # Longer pause after sentence
-                "semicolon": 2.5,    # Programming statement end
-                "newline": 1.5,      # New line pause
-                "thinking": 4.0,     # General thinking pause
-                "brace": 1.8,        # After opening/closing braces
-            }
-            
-            multiplier = pause_multipliers.get(pause_type, 1.0)
+            multiplier = self.pause_multipliers.get(pause_type, 1.0)
             pause_delay = base_delay * multiplier
         
         # Add randomness to pauses if enabled
         if self.randomness > 0:
             std_dev = pause_delay * 0.4 * self.randomness
-            variation = max(0, random.gauss(0, std_dev))  # No negative pauses
+            variation = max(0, std_dev * self._rng.standard_normal())  # No negative pauses
             pause_delay += variation
         
         return pause_delay
 
+    def precompute_noise(self, n: int) -> np.ndarray:
+        """Draw n standard normal values for scaling into random timing variation"""
+        return self._rng.standard_normal(n)
+
+    def get_typing_delays(self, code: str) -> np.ndarray:
+        """
+        Calculate the delay for every character of a code block at once
+
+        Vectorized equivalent of get_character_delay plus the natural pause
+        that follows each character.
+
+        Args:
+            code: Text being typed
+
+        Returns:
+            Array of delays in seconds, one per character
+        """
+        base_delay = 1.0 / self.base_speed
+        char_codes = np.frombuffer(code.encode('utf-32-le'), dtype=np.uint32)
+
+        # Character delays
+        if self.realistic:
+            difficulty = np.where(char_codes < 128,
+                                  self._difficulty_lut[np.minimum(char_codes, 127)], 1.5)
+            fast_mult, slow_mult = self.precompute_multipliers(code)
+            pattern_multipliers = np.where(slow_mult > 1.0, slow_mult, fast_mult)
+            delays = base_delay * difficulty * pattern_multipliers
+        else:
+            delays = np.full(len(code), base_delay)
+
+        if self.randomness > 0:
+            delays += self.precompute_noise(len(code)) * delays * 0.3 * self.randomness
+
+        delays = np.maximum(delays, base_delay * 0.2)
+
+        # Natural pauses after punctuation, newlines and braces
+        pauses = np.zeros(len(code))
+        unmatched = np.ones(len(code), dtype=bool)
+        for chars, pause_type in self.pause_chars:
+            mask = unmatched & np.isin(char_codes, [ord(char) for char in chars])
+            multiplier = self.pause_multipliers[pause_type] if self.realistic else 1.0
+            pauses[mask] = base_delay * multiplier
+            unmatched &= ~mask
+
+        if self.randomness > 0:
+            noise = self.precompute_noise(len(code))
+            pauses += np.maximum(0, noise * pauses * 0.4 * self.randomness)
+
+        return delays + pauses
+
+
+# Color categories produced by SyntaxHighlighter, in Theme.color_lut row order
+COLOR_KEYS = ('keyword', 'string', 'comment', 'number', 'function', 'class', 'operator',
+              'default')
+
 
 class Theme:
     """Represents a color theme for syntax highlighting"""
@@ -172,6 +373,18 @@ class Theme:
         self.cursor = tuple(cursor)
         self.colors = {k: tuple(v) for k, v in colors.items()}
 
+        # RGB rows for the color categories, missing ones taking the default color
+        self.color_index = {key: i for i, key in enumerate(COLOR_KEYS)}
+        self.color_lut = np.array([self.colors.get(key, self.colors['default'])
+                                   for key in COLOR_KEYS], dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_theme_file(theme_path: str, mtime: float) -> Dict[str, Any]:
+    """Parse a theme file, cached until its modification time changes"""
+    with open(theme_path, 'r') as f:
+        return json.load(f)
+
 
 class ThemeManager:
     """Manages loading and accessing themes"""
@@ -194,8 +407,7 @@ class ThemeManager:
                 theme_path = os.path.join(self.themes_dir, filename)
                 
                 try:
-                    with open(theme_path, 'r') as f:
-                        theme_data = json.load(f)
+                    theme_data = _read_theme_file(theme_path, os.path.getmtime(theme_path))
                     
                     theme = Theme(
                         name=theme_data['name'],
@@ -207,7 +419,8 @@ class ThemeManager:
                     
                     self._themes[theme_name] = theme
                     
-                except (json.JSONDecodeError, KeyError, FileNotFoundError) as e:
+                except (json.JSONDecodeError, KeyError, FileNotFoundError,
+                        ValueError, OverflowError, TypeError) as e:
                     print(f"Warning: Could not load theme '{filename}': {e}")
         
         # If no themes were loaded, load defaults
@@ -272,6 +485,17 @@ class ThemeManager:
         return [(name, theme.description) for name, theme in self._themes.items()]
 
 
+_THEME_MANAGER_SINGLETON: Optional[ThemeManager] = None
+
+
+def _get_theme_manager() -> ThemeManager:
+    """Get the shared ThemeManager, loading the themes directory on first use"""
+    global _THEME_MANAGER_SINGLETON
+    if _THEME_MANAGER_SINGLETON is None:
+        _THEME_MANAGER_SINGLETON = ThemeManager()
+    return _THEME_MANAGER_SINGLETON
+
+
 class CodeBlock:
     """Represents a code block from markdown"""
 
@@ -281,6 +505,21 @@ class CodeBlock:
         self.lines = code.strip().split('\n')
 
 
+class BlockLayout(NamedTuple):
+    """
+    Where every character of a code block is drawn
+
+    Positions run from 0 to len(text), so each array also holds where the
+    cursor sits once that many characters have been typed.
+    """
+    text: str
+    xs: np.ndarray
+    ys: np.ndarray
+    lines: np.ndarray
+    color_ids: np.ndarray  # Palette index of each character
+    line_starts: List[int]
+
+
 class VideoConfig:
     """Configuration for video generation"""
 
@@ -305,12 +544,99 @@ class VideoConfig:
         self.randomness = randomness
         
         # Load theme configuration
-        theme_manager = ThemeManager()
+        theme_manager = _get_theme_manager()
         self.theme = theme_manager.get_theme(theme)
         self.bg_color = self.theme.background
         self.cursor_color = self.theme.cursor
 
 
+@functools.lru_cache(maxsize=64)
+def _cached_lexer(language: str):
+    """Get a pygments lexer for a language, reusing it across code blocks"""
+    return get_lexer_by_name(language, stripall=True)
+
+
+def _token_cache_dir() -> Optional[str]:
+    """
+    Directory for lexed code blocks kept between runs, see _tokenize
+
+    CODE_TO_VIDEO_CACHE_DIR overrides it, and an empty value disables the
+    disk cache. Otherwise it lives under $XDG_CACHE_HOME (~/.cache).
+    """
+    cache_dir = os.environ.get('CODE_TO_VIDEO_CACHE_DIR')
+    if cache_dir is not None:
+        return cache_dir or None
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),
+                                                                  '.cache')
+    return os.path.join(cache_home, 'code_to_video', 'tokencache')
+
+
+@functools.lru_cache(maxsize=256)
+def _tokenize(code: str, language: str) -> Tuple[Tuple[Any, str], ...]:
+    """
+    Lex code into (token type, text) pairs
+
+    Results are cached in memory and, best effort, on disk, keyed by the
+    code, language and pygments version.
+    """
+    cache_dir = _token_cache_dir()
+    if cache_dir is None:
+        return tuple(_cached_lexer(language).get_tokens(code))
+
+    key = hashlib.sha256(f'{pygments.__version__}\0{language}\0{code}'.encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f'{key}.json')
+
+    # Unreadable or malformed entries are lexed again and overwritten
+    try:
+        with open(cache_path, 'r') as f:
+            return tuple((string_to_tokentype(token_type), text)
+                         for token_type, text in json.load(f))
+    except (OSError, ValueError, TypeError):
+        pass
+
+    tokens = tuple(_cached_lexer(language).get_tokens(code))
+
+    # Write to a temporary file first, so other processes never read half a file
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump([('.'.join(token_type), text) for token_type, text in tokens], f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+    return tokens
+
+
+# Theme color category of each pygments token type, subtypes included
+_TOKEN_COLOR_MAP = {
+    Token.Keyword: 'keyword',
+    Token.Literal: 'number',
+    Token.Literal.String: 'string',
+    Token.Literal.Number: 'number',
+    Token.Comment: 'comment',
+    Token.Name.Function: 'function',
+    Token.Name.Class: 'class',
+    Token.Operator: 'operator',
+    Token.Punctuation: 'operator',
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _color_key_for_token(token_type) -> str:
+    """Map a pygments token type to one of the theme's color categories"""
+    # Walk up to the closest mapped parent, e.g. String.Double -> String
+    while token_type is not None:
+        color_key = _TOKEN_COLOR_MAP.get(token_type)
+        if color_key is not None:
+            return color_key
+        token_type = token_type.parent
+
+    return 'default'
+
+
 class SyntaxHighlighter:
     """Handles syntax highlighting for different languages"""
 
@@ -326,87 +652,240 @@ class SyntaxHighlighter:
             if language == 'text' or not language:
                 return [(code, 'default')]
 
-            lexer = get_lexer_by_name(language, stripall=True)
-            tokens = list(lexer.get_tokens(code))
-
-            result = []
-            for token_type, text in tokens:
-                token_name = str(token_type).split('.')[-1].lower()
-
-                # Map token types to our color categories
-                if 'keyword' in token_name:
-                    color_key = 'keyword'
-                elif 'string' in token_name or 'literal' in token_name:
-                    color_key = 'string' if 'string' in token_name else 'number'
-                elif 'comment' in token_name:
-                    color_key = 'comment'
-                elif 'name' in token_name:
-                    if 'function' in token_name:
-                        color_key = 'function'
-                    elif 'class' in token_name:
-                        color_key = 'class'
-                    else:
-                        color_key = 'default'
-                elif 'operator' in token_name or 'punctuation' in token_name:
-                    color_key = 'operator'
-                else:
-                    color_key = 'default'
-
-                result.append((text, color_key))
-
-            return result
+            # Map token types to our color categories
+            return [(text, _color_key_for_token(token_type))
+                    for token_type, text in _tokenize(code, language)]
 
         except Exception as e:
             print(f"Warning: Could not highlight {language} code, using plain text: {e}")
             return [(code, 'default')]
 
+    def resolve_colors(self, highlighted_tokens: List[Tuple[str, str]]
+                       ) -> List[Tuple[str, Tuple[int, int, int]]]:
+        """Replace the token types from get_highlighted_text with their theme colors"""
+        default = self.colors['default']
+        return [(text, self.colors.get(token_type, default))
+                for text, token_type in highlighted_tokens]
+
+
+# ffmpeg options for each H.264 encoder _h264_encoder can pick
+_H264_ENCODER_ARGS = {
+    'h264_nvenc': ('-c:v', 'h264_nvenc', '-preset', 'p4', '-cq', '23'),
+    'libx264': ('-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23'),
+}
+
+# Consumer NVIDIA drivers limit how many NVENC sessions can run at once
+_NVENC_MAX_SESSIONS = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _h264_encoder() -> str:
+    """H.264 encoder for ffmpeg, NVENC when an NVIDIA GPU can encode, otherwise libx264"""
+    if shutil.which('nvidia-smi') and shutil.which('ffmpeg'):
+        # Encode a few blank frames, since ffmpeg may list NVENC without a usable GPU
+        try:
+            probe = subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error',
+                                    '-f', 'lavfi', '-i', 'color=black:s=256x256:d=0.1',
+                                    '-c:v', 'h264_nvenc', '-f', 'null', '-'],
+                                   stdin=subprocess.DEVNULL, capture_output=True, timeout=30)
+            if probe.returncode == 0:
+                return 'h264_nvenc'
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    return 'libx264'
+
+
+def _h264_encoder_args() -> Tuple[str, ...]:
+    """ffmpeg encoder options for the encoder picked by _h264_encoder"""
+    return _H264_ENCODER_ARGS[_h264_encoder()]
+
+
+class FFmpegWriter:
+    """Writes BGR frames to an H.264 video through an ffmpeg process, like cv2.VideoWriter"""
+
+    def __init__(self, output_path: str, fps: float, size: Tuple[int, int]):
+        # yuv420p needs even dimensions, so odd ones are padded with black
+        width, height = size
+        padded_width, padded_height = width + width % 2, height + height % 2
+        self._padded = None
+        if (padded_width, padded_height) != (width, height):
+            self._padded = np.zeros((padded_height, padded_width, 3), dtype=np.uint8)
+
+        # Frames are piped as YUV 4:2:0, half the bytes of BGR and already in
+        # the format H.264 encodes
+        self._yuv = np.empty((padded_height * 3 // 2, padded_width), dtype=np.uint8)
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-s', f'{padded_width}x{padded_height}',
+            '-r', str(fps), '-i', '-',
+            *_h264_encoder_args(), '-pix_fmt', 'yuv420p',
+            output_path,
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, bufsize=10**7)
+
+    def write(self, frame: np.ndarray):
+        """Convert one BGR frame and send it to the encoder"""
+        if self._padded is not None:
+            self._padded[:frame.shape[0], :frame.shape[1]] = frame
+            frame = self._padded
+
+        cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=self._yuv)
+        self._process.stdin.write(self._yuv.data)
+
+    def release(self):
+        """Finish encoding and wait for ffmpeg to exit"""
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {self._process.returncode}")
+
+
+class ThreadedWriter:
+    """
+    Wraps a video writer so frames are encoded on a background thread
+
+    Rendering the next frame overlaps with encoding the previous ones. Frames
+    are copied when written, since the generator reuses its frame buffer.
+    """
+
+    def __init__(self, writer, maxsize: int = 16):
+        self._writer = writer
+        self._frames = queue.Queue(maxsize=maxsize)
+
+        # Frame copies are recycled once encoded, rather than allocated per frame
+        self._free_buffers = queue.Queue()
+        self._buffer_count = 0
+        self._max_buffers = maxsize + 2
+
+        self._error = None
+        self._thread = threading.Thread(target=self._encode_frames, daemon=True)
+        self._thread.start()
+
+    def _encode_frames(self):
+        """Write queued frames until the end marker, keeping the first error"""
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+
+            if self._error is None:
+                try:
+                    self._writer.write(frame)
+                except Exception as e:
+                    self._error = e
+            self._free_buffers.put(frame)
+
+    def write(self, frame: np.ndarray):
+        """Queue a copy of one frame for encoding"""
+        if self._error is not None:
+            raise self._error
+
+        try:
+            buffer = self._free_buffers.get_nowait()
+        except queue.Empty:
+            if self._buffer_count < self._max_buffers:
+                buffer = np.empty_like(frame)
+                self._buffer_count += 1
+            else:
+                buffer = self._free_buffers.get()
+
+        np.copyto(buffer, frame)
+        self._frames.put(buffer)
+
+    def release(self):
+        """Wait for the queued frames to be encoded, then release the writer"""
+        self._frames.put(None)
+        self._thread.join()
+        self._writer.release()
+
+        if self._error is not None:
+            raise self._error
+
+
+@functools.lru_cache(maxsize=None)
+def _load_font(font_size: int):
+    """Load a suitable monospace font, once per size"""
+    font_paths = [
+        '/System/Library/Fonts/Monaco.ttf',  # macOS
+        '/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf',  # Linux
+        'C:/Windows/Fonts/consola.ttf',  # Windows
+    ]
+
+    for font_path in font_paths:
+        try:
+            # Code needs no text shaping, so skip Raqm even where it is installed
+            return ImageFont.truetype(font_path, font_size,
+                                      layout_engine=ImageFont.Layout.BASIC)
+        except (OSError, IOError):
+            continue
+
+    # Fallback to default font
+    try:
+        return ImageFont.load_default()
+    except BaseException:
+        return None
+
 
 class CodeToVideoGenerator:
     """Main class for generating videos from code blocks"""
 
-    def __init__(self, config: VideoConfig):
+    def __init__(self, config: VideoConfig, seed=None):
         self.config = config
         self.highlighter = SyntaxHighlighter(config.theme)
         
         # Initialize typing realism system
-        self.typing_realism = TypingRealism(config.typing_speed, config.realistic, config.randomness)
+        self.typing_realism = TypingRealism(config.typing_speed, config.realistic,
+                                            config.randomness, seed)
+        self._seed = seed
+        self._delay_cache: Dict[str, np.ndarray] = {}
 
         # Try to load a monospace font
-        self.font = self._load_font()
-
-    def _load_font(self):
-        """Load a suitable monospace font"""
-        font_paths = [
-            '/System/Library/Fonts/Monaco.ttf',  # macOS
-            '/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf',  # Linux
-            'C:/Windows/Fonts/consola.ttf',  # Windows
-        ]
+        self.font = _load_font(config.font_size)
 
-        for font_path in font_paths:
-            try:
-                return ImageFont.truetype(font_path, self.config.font_size)
-            except (OSError, IOError):
-                continue
+        # Use a space character to estimate character width
+        self._char_px = None
+        if self.font:
+            space_bbox = self.font.getbbox(' ')
+            self._space_px = space_bbox[2] - space_bbox[0]
 
-        # Fallback to default font
-        try:
-            return ImageFont.load_default()
-        except BaseException:
-            return None
+            # Monospace fonts advance the same width for every character
+            if self.font.getlength('M') == self.font.getlength('i'):
+                self._char_px = self.font.getlength('M')
 
-    def parse_markdown(self, markdown_content: str) -> List[CodeBlock]:
-        """Extract code blocks from markdown content"""
-        code_blocks = []
+        # Token colors by palette index, starting with the theme's color LUT so
+        # color categories keep their Theme.color_index
+        self._palette: List[Tuple[int, int, int]] = [
+            tuple(color) for color in config.theme.color_lut.tolist()
+        ]
+        self._palette_ids: Dict[Tuple[int, int, int], int] = {}
+        for color_id, color in enumerate(self._palette):
+            self._palette_ids.setdefault(color, color_id)
+        for color in config.theme.colors.values():
+            self._color_id(color)
+
+        # Rasterized characters by (char, color id). Printable ASCII is rendered
+        # up front in every theme color, anything else as it is first typed
+        self._glyph_atlas: Dict[Tuple[str, int], Any] = {}
+        if self.font:
+            for color_id in sorted(set(self._palette_ids.values())):
+                for char in _PRINTABLE_ASCII:
+                    self._glyph(char, color_id)
 
-        # Pattern to match fenced code blocks
-        pattern = r'```(\w+)?\n(.*?)\n```'
-        matches = re.findall(pattern, markdown_content, re.DOTALL)
+        self._canvas = None
+        self._bg_template = None
+        self.reset_canvas()
 
-        for language, code in matches:
-            if code.strip():  # Skip empty code blocks
-                code_blocks.append(CodeBlock(language, code))
+        # Blank frame shown between code blocks, and how long the holds last
+        self._clear_bgr = np.full((config.height, config.width, 3), config.bg_color[::-1],
+                                  dtype=np.uint8)
+        self._hold_frames = int(config.fps * config.pause_duration)
+        self._clear_frames = int(config.fps * 0.5)  # Half second clear
 
-        return code_blocks
+    def parse_markdown(self, markdown_content: str) -> List[CodeBlock]:
+        """Extract code blocks from markdown content"""
+        return [CodeBlock(match.group(1), match.group(2))
+                for match in _FENCE_RE.finditer(markdown_content)
+                if match.group(2).strip()]  # Skip empty code blocks
 
     def _calculate_indentation_width(self, text: str, start_pos: int) -> int:
         """Calculate the visual width of indentation after a newline"""
@@ -427,174 +906,484 @@ class CodeToVideoGenerator:
 
         # Convert to pixel width (approximate)
         if self.font:
-            # Use a space character to estimate character width
-            space_bbox = self.font.getbbox(' ')
-            char_width = space_bbox[2] - space_bbox[0]
-            return int(indent_width * char_width)
+            return int(indent_width * self._space_px)
 
         return indent_width * 8  # Fallback estimate
 
-    def create_frame(self, text_content: str, highlighted_tokens: List[Tuple[str, str]],
-                     current_pos: int) -> np.ndarray:
-        """Create a single frame of the video"""
-        # Create PIL image
-        img = Image.new('RGB', (self.config.width, self.config.height), self.config.bg_color)
-        draw = ImageDraw.Draw(img)
+    def _build_indent_map(self, text: str) -> Dict[int, int]:
+        """Map the position after every newline to the pixel width of its indentation"""
+        return {
+            newline + 1: self._calculate_indentation_width(text, newline + 1)
+            for newline in (match.start() for match in re.finditer('\n', text))
+        }
 
-        # Starting position
-        x, y = 20, 20
+    def reset_canvas(self, bg_color: Optional[Tuple[int, int, int]] = None,
+                     size: Optional[Tuple[int, int]] = None):
+        """Start a blank canvas for incremental frame rendering"""
+        bg_color = tuple(bg_color or self.config.bg_color)
+        width, height = size or (self.config.width, self.config.height)
+
+        # The canvas is drawn into one reusable buffer, kept in OpenCV's BGR
+        # channel order so frames can be written without converting them
+        if self._canvas is None or self._canvas.shape[:2] != (height, width):
+            self._canvas = np.empty((height, width, 3), dtype=np.uint8)
+            self._bg_template = None
+
+        # Blank background, copied in whenever the canvas is cleared
+        if self._bg_template is None or self._bg_color != bg_color:
+            self._bg_color = bg_color
+            self._bg_template = np.empty_like(self._canvas)
+            self._bg_template[...] = bg_color[::-1]
+        np.copyto(self._canvas, self._bg_template)
+
+        self._char_count = 0
+
+        # What the canvas shows, and where each of its characters goes
+        self._canvas_text = None
+        self._canvas_tokens = None
+        self._layout: Optional[BlockLayout] = None
+        self._glyph_tensor = None
+
+        # A copy of every finished line, so going back only redraws the current line
+        self._line_images = []
+
+        # Pixels hidden under the cursor, restored before the next draw
+        self._cursor_patch = None
+
+    def _color_id(self, color: Tuple[int, int, int]) -> int:
+        """Palette index of a color, adding it to the palette the first time"""
+        color_id = self._palette_ids.get(color)
+        if color_id is None:
+            color_id = self._palette_ids[color] = len(self._palette)
+            self._palette.append(color)
+        return color_id
+
+    def _glyph(self, char: str, color_id: int):
+        """Look up a character in the glyph atlas, rasterizing it the first time"""
+        try:
+            return self._glyph_atlas[(char, color_id)]
+        except KeyError:
+            glyph = self._render_glyph(char, self._palette[color_id])
+            self._glyph_atlas[(char, color_id)] = glyph
+            return glyph
+
+    def _layout_block(self, text_content: str,
+                      colored_tokens: List[Tuple[str, Tuple[int, int, int]]]) -> BlockLayout:
+        """Work out where every character of a code block is drawn, and in which color"""
+        text = ''.join(token_text for token_text, _ in colored_tokens)
         line_height = self.config.font_size + 4
         left_margin = 20
 
-        # Draw the text up to current position
-        char_count = 0
-        for token_text, token_type in highlighted_tokens:
-            if char_count >= current_pos:
-                break
-
-            # Process each character individually to properly handle newlines
-            remaining_chars = current_pos - char_count
-            chars_to_process = min(len(token_text), remaining_chars)
-
-            if chars_to_process <= 0:
-                break
-
-            text_to_process = token_text[:chars_to_process]
-            color = self.highlighter.colors.get(token_type, self.highlighter.colors['default'])
-
-            # Process character by character to handle newlines properly
-            current_line = ""
-            for i, char in enumerate(text_to_process):
-                if char == '\n':
-                    # Draw the current line if it has content
-                    if current_line and self.font:
-                        draw.text((x, y), current_line, font=self.font, fill=color)
-                    # Move to next line
-                    y += line_height
-
-                    # Calculate indentation for the next line
-                    next_char_pos = char_count + i + 1
-                    indent_width = self._calculate_indentation_width(text_content, next_char_pos)
-                    x = left_margin + indent_width
-
-                    current_line = ""
-                else:
-                    current_line += char
-
-            # Draw any remaining text on the current line
-            if current_line and self.font:
-                draw.text((x, y), current_line, font=self.font, fill=color)
-                bbox = draw.textbbox((x, y), current_line, font=self.font)
-                x = bbox[2]
-
-            char_count += chars_to_process
-
-            if char_count >= current_pos:
-                break
-
-        # Add cursor
+        # Spread each token's palette index over its characters
+        token_ids = [self._color_id(color) for _, color in colored_tokens]
+        token_lengths = [len(token_text) for token_text, _ in colored_tokens]
+        color_ids = np.repeat(np.array(token_ids, dtype=np.uint8), token_lengths)
+
+        # Line of every position, and where each line starts
+        is_newline = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32) == ord('\n')
+        lines = np.concatenate(([0], np.cumsum(is_newline)))
+        line_starts = np.concatenate(([0], np.flatnonzero(is_newline) + 1))
+
+        # Each line starts after its indentation, and moves right by the
+        # advance of every character typed on it
+        if not self.font:
+            advances = np.zeros(len(text))
+        elif self._char_px:
+            advances = np.full(len(text), self._char_px)
+        else:
+            advances = np.array([self.font.getlength(char) for char in text], dtype=float)
+        advances[is_newline] = 0
+        offsets = np.concatenate(([0.0], np.cumsum(advances)))
+
+        indent_map = self._build_indent_map(text_content)
+        line_x = np.array([left_margin + indent_map.get(start, 0) for start in line_starts[1:]],
+                          dtype=float)
+        line_x = np.concatenate(([left_margin], line_x))
+        xs = line_x[lines] + (offsets - offsets[line_starts][lines])
+        ys = 20 + lines * line_height
+
+        return BlockLayout(text, xs, ys, lines, color_ids, line_starts.tolist())
+
+    def _build_glyph_tensor(self, layout: BlockLayout):
+        """
+        Stack the glyphs a block uses into padded arrays for _paste_glyphs
+
+        Returns:
+            (inverse_alpha, ink, glyph_left, glyph_top, glyph_ids, xs, ys)
+        """
+        glyph_keys: Dict[Tuple[str, int], int] = {}
+        blends = []
+        glyph_ids = np.full(len(layout.text), -1, dtype=np.int64)
+        for pos, key in enumerate(zip(layout.text, layout.color_ids.tolist())):
+            if key[0] == '\n':
+                continue
+
+            glyph = glyph_keys.get(key)
+            if glyph is None:
+                blend = self._glyph(*key)
+                glyph = glyph_keys[key] = -1 if blend is None else len(blends)
+                if blend is not None:
+                    blends.append(blend)
+            glyph_ids[pos] = glyph
+
+        glyph_h = max((ink.shape[0] for _, _, _, ink in blends), default=0)
+        glyph_w = max((ink.shape[1] for _, _, _, ink in blends), default=0)
+        inverse_alpha = np.full((len(blends), glyph_h, glyph_w), 255, dtype=np.uint32)
+        ink = np.zeros((len(blends), glyph_h, glyph_w, 3), dtype=np.uint32)
+        for glyph, (_, _, glyph_inverse_alpha, glyph_ink) in enumerate(blends):
+            h, w = glyph_ink.shape[:2]
+            inverse_alpha[glyph, :h, :w] = glyph_inverse_alpha[..., 0]
+            ink[glyph, :h, :w] = glyph_ink
+
+        glyph_left = np.array([left for left, _, _, _ in blends], dtype=np.int64)
+        glyph_top = np.array([top for _, top, _, _ in blends], dtype=np.int64)
+        return (inverse_alpha, ink, glyph_left, glyph_top, glyph_ids,
+                layout.xs.astype(np.int64), layout.ys.astype(np.int64))
+
+    def _rewind_canvas(self, current_pos: int):
+        """Go back to the start of the line holding current_pos, pasting finished lines"""
+        layout = self._layout
+        line = layout.lines[current_pos]
+
+        np.copyto(self._canvas, self._bg_template)
+        for line_start, image in zip(layout.line_starts[:line], self._line_images):
+            line_y = layout.ys[line_start]
+            self._canvas[line_y:line_y + len(image)] = image
+
+        self._char_count = layout.line_starts[line]
+        self._cursor_patch = None
+
+    def _render_glyph(self, char: str, color: Tuple[int, int, int]):
+        """
+        Rasterize one character for the glyph atlas
+
+        Returns:
+            None for blank characters, otherwise (left, top, inverse_alpha, ink)
+            ready for _draw_glyph to blend
+        """
+        left, top, right, bottom = self.font.getbbox(char)
+        if right <= left or bottom <= top:
+            return None
+
+        # Draw the glyph's coverage mask the way PIL would draw it on the canvas
+        pad_x, pad_y = max(0, -left), max(0, -top)
+        mask_img = Image.new('L', (right + pad_x, bottom + pad_y), 0)
+        ImageDraw.Draw(mask_img).text((pad_x, pad_y), char, font=self.font, fill=255)
+        alpha = np.asarray(mask_img, dtype=np.uint32)[top + pad_y:, left + pad_x:, np.newaxis]
+        if not alpha.any():
+            return None
+
+        # Ink is stored in BGR order, like the canvas
+        ink = alpha * np.array(color[::-1], dtype=np.uint32)
+        return left, top, 255 - alpha, ink
+
+    def _draw_glyph(self, char: str, color_id: int, x: float, y: int):
+        """Blend one character into the canvas from the glyph atlas"""
+        blend = self._glyph(char, color_id)
+        if blend is None:
+            return
+
+        canvas = self._canvas
+        height, width = canvas.shape[:2]
+        left, top, inverse_alpha, ink = blend
+        x0, y0 = int(x) + left, y + top
+        x1, y1 = x0 + ink.shape[1], y0 + ink.shape[0]
+
+        # Clip to the canvas
+        cx0, cy0, cx1, cy1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        if cx0 < cx1 and cy0 < cy1:
+            region = canvas[cy0:cy1, cx0:cx1]
+            clip = (slice(cy0 - y0, cy1 - y0), slice(cx0 - x0, cx1 - x0))
+
+            # Same rounding as PIL's mask blending: (v + 128 + ((v + 128) >> 8)) >> 8
+            blended = region * inverse_alpha[clip] + ink[clip] + 128
+            region[...] = (blended + (blended >> 8)) >> 8
+
+    def _draw_glyphs(self, start: int, end: int):
+        """Blend the characters typed at positions start to end of the current block"""
+        if self._glyph_tensor is not None:
+            _paste_glyphs(self._canvas, *self._glyph_tensor, start, end)
+            return
+
+        layout = self._layout
+        for pos in range(start, end):
+            if layout.text[pos] != '\n':
+                self._draw_glyph(layout.text[pos], layout.color_ids[pos], layout.xs[pos],
+                                 int(layout.ys[pos]))
+
+    def create_frame(self, text_content: str,
+                     colored_tokens: List[Tuple[str, Tuple[int, int, int]]],
+                     current_pos: int) -> np.ndarray:
+        """
+        Create a single frame of the video
+
+        Tokens are (text, color) pairs, as returned by SyntaxHighlighter.resolve_colors.
+        The layout of the code is worked out on the first call, and the canvas
+        is kept between calls, so typing forward through the same code only
+        draws the characters added since the previous frame, and going back
+        only redraws the line it lands on. The returned array is reused, and
+        overwritten by the next call.
+        """
+        if colored_tokens is not self._canvas_tokens or text_content != self._canvas_text:
+            self.reset_canvas()
+            self._canvas_text = text_content
+            self._canvas_tokens = colored_tokens
+            self._layout = self._layout_block(text_content, colored_tokens)
+            if _paste_glyphs is not None and self.font:
+                self._glyph_tensor = self._build_glyph_tensor(self._layout)
+
+        layout = self._layout
+        current_pos = min(current_pos, len(layout.text))
+        if current_pos < self._char_count:
+            self._rewind_canvas(current_pos)
+        elif self._cursor_patch:
+            patch, (patch_x, patch_y) = self._cursor_patch
+            patch_h, patch_w = patch.shape[:2]
+            self._canvas[patch_y:patch_y + patch_h, patch_x:patch_x + patch_w] = patch
+        self._cursor_patch = None
+
+        # Draw only the text typed since the previous frame
+        line_height = self.config.font_size + 4
+        pos = self._char_count
+        while pos < current_pos:
+            # Draw up to the end of the line, or as far as has been typed
+            line = layout.lines[pos]
+            if line + 1 < len(layout.line_starts):
+                newline_pos = layout.line_starts[line + 1] - 1
+            else:
+                newline_pos = len(layout.text)
+            end = min(current_pos, newline_pos)
+            if self.font:
+                self._draw_glyphs(pos, end)
+            pos = end
+
+            # Keep the finished line the first time it is completed
+            if pos == newline_pos and pos < current_pos:
+                if line == len(self._line_images):
+                    y = int(layout.ys[pos])
+                    self._line_images.append(self._canvas[y:y + line_height].copy())
+                pos += 1
+        self._char_count = current_pos
+
+        # Add cursor, remembering what it covers
         if current_pos < len(text_content):
-            cursor_color = self.config.cursor_color
-            draw.rectangle([x, y, x + 2, y + self.config.font_size], fill=cursor_color)
+            cursor_x, cursor_y = int(layout.xs[current_pos]), int(layout.ys[current_pos])
+            cursor = self._canvas[cursor_y:cursor_y + self.config.font_size + 1,
+                                  cursor_x:cursor_x + 3]
+            self._cursor_patch = (cursor.copy(), (cursor_x, cursor_y))
+            cursor[...] = self.config.cursor_color[::-1]
 
-        # Convert PIL image to OpenCV format
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        return cv_img
+        return self._canvas
 
-    def generate_video(self, code_blocks: List[CodeBlock], output_path: str):
-        """Generate the complete video with realistic typing"""
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, self.config.fps,
-                              (self.config.width, self.config.height))
+    def _open_video_writer(self, output_path: str):
+        """
+        Open an H.264 video writer
 
+        Frames are piped to ffmpeg when it is installed, otherwise encoded by
+        OpenCV, falling back to MPEG-4 if OpenCV lacks an H.264 encoder.
+        """
+        size = (self.config.width, self.config.height)
+
+        if shutil.which('ffmpeg'):
+            return FFmpegWriter(output_path, self.config.fps, size)
+
+        # H.264 keeps long runs of identical frames (pauses, holds) nearly free
+        log_level = cv2.utils.logging.getLogLevel()
+        cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_SILENT)
         try:
-            for i, block in enumerate(code_blocks):
-                print(f"Processing code block {i + 1}/{len(code_blocks)} ({block.language})")
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'avc1'), self.config.fps,
+                                  size, [cv2.VIDEOWRITER_PROP_QUALITY, 80])
+        finally:
+            cv2.utils.logging.setLogLevel(log_level)
 
-                # Get syntax highlighted tokens
-                highlighted_tokens = self.highlighter.get_highlighted_text(
-                    block.code, block.language)
+        if not out.isOpened():
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), self.config.fps,
+                                  size)
+        return out
 
-                if self.config.realistic or self.config.randomness > 0:
-                    self._generate_realistic_typing_frames(out, block, highlighted_tokens)
-                else:
-                    self._generate_uniform_typing_frames(out, block, highlighted_tokens)
+    def generate_video(self, code_blocks: List[CodeBlock], output_path: str):
+        """Generate the complete video with realistic typing"""
+        # Code blocks are independent, so render them on separate cores when
+        # ffmpeg is available to join the clips
+        workers = min(len(code_blocks), os.cpu_count() or 1)
+        if workers > 1 and shutil.which('ffmpeg'):
+            # Every worker opens its own encoder session
+            if _h264_encoder() == 'h264_nvenc':
+                workers = min(workers, _NVENC_MAX_SESSIONS)
+            self._generate_video_parallel(code_blocks, output_path, workers)
+            return
 
-                # Hold the final frame
-                final_frame = self.create_frame(block.code, highlighted_tokens, len(block.code))
-                for _ in range(int(self.config.fps * self.config.pause_duration)):
-                    out.write(final_frame)
+        out = ThreadedWriter(self._open_video_writer(output_path))
 
+        try:
+            for i, block in enumerate(code_blocks):
+                print(f"Processing code block {i + 1}/{len(code_blocks)} ({block.language})")
                 # Clear screen between blocks (except for the last one)
-                if i < len(code_blocks) - 1:
-                    clear_frame = np.full((self.config.height, self.config.width, 3),
-                                          self.config.bg_color, dtype=np.uint8)
-                    clear_frame = cv2.cvtColor(clear_frame, cv2.COLOR_RGB2BGR)
-                    for _ in range(int(self.config.fps * 0.5)):  # Half second clear
-                        out.write(clear_frame)
+                self._write_block(out, block, clear_after=i < len(code_blocks) - 1)
 
         finally:
             out.release()
-            cv2.destroyAllWindows()
+
+    def _block_seeds(self, count: int) -> List[np.random.SeedSequence]:
+        """Independent random streams for parallel blocks, reproducible when seeded"""
+        return np.random.SeedSequence(self._seed).spawn(count)
+
+    def _generate_video_parallel(self, code_blocks: List[CodeBlock], output_path: str,
+                                 workers: int):
+        """Render each code block to its own clip in a worker process, then join them"""
+        print(f"Rendering {len(code_blocks)} code blocks with {workers} processes")
+
+        seeds = self._block_seeds(len(code_blocks))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            clip_paths = [os.path.join(tmpdir, f'block_{i}.mp4') for i in range(len(code_blocks))]
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_render_block_to_file, self.config, block, clip_path,
+                                    i < len(code_blocks) - 1, seed)
+                    for i, (block, clip_path, seed)
+                    in enumerate(zip(code_blocks, clip_paths, seeds))
+                ]
+                for i, (block, future) in enumerate(zip(code_blocks, futures)):
+                    future.result()
+                    print(f"Finished code block {i + 1}/{len(code_blocks)} ({block.language})")
+
+            # Join the clips without re-encoding
+            list_path = os.path.join(tmpdir, 'clips.txt')
+            with open(list_path, 'w') as f:
+                for clip_path in clip_paths:
+                    f.write(f"file '{clip_path}'\n")
+
+            # ffmpeg would otherwise read the terminal, stopping a backgrounded run
+            subprocess.run(['ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-f', 'concat',
+                            '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+                           stdin=subprocess.DEVNULL, check=True)
+
+    def _write_block(self, out, block: CodeBlock, clear_after: bool):
+        """Write the typing animation of one code block, its final hold and optional clear"""
+        write = out.write
+        self.reset_canvas()
+
+        # Get syntax highlighted tokens
+        highlighted_tokens = self.highlighter.get_highlighted_text(block.code, block.language)
+        colored_tokens = self.highlighter.resolve_colors(highlighted_tokens)
+
+        if self.config.realistic or self.config.randomness > 0:
+            last_pos, last_frame = self._generate_realistic_typing_frames(out, block,
+                                                                          colored_tokens)
+        else:
+            last_pos, last_frame = self._generate_uniform_typing_frames(out, block,
+                                                                        colored_tokens)
+
+        # Hold the final frame, which typing usually ends on already
+        if last_pos == len(block.code):
+            final_frame = last_frame
+        else:
+            final_frame = self.create_frame(block.code, colored_tokens, len(block.code))
+        for _ in range(self._hold_frames):
+            write(final_frame)
+
+        if clear_after:
+            for _ in range(self._clear_frames):
+                write(self._clear_bgr)
     
-    def _generate_realistic_typing_frames(self, out, block: CodeBlock, highlighted_tokens):
-        """Generate frames with realistic typing timing"""
-        current_pos = 0
-        accumulated_time = 0.0
-        frame_time = 1.0 / self.config.fps
-        
-        while current_pos < len(block.code):
-            char = block.code[current_pos]
-            
-            # Calculate realistic delay for this character
-            char_delay = self.typing_realism.get_character_delay(
-                char, block.code, current_pos
-            )
-            
-            # Add natural pauses after certain characters
-            if char in ',.;':
-                char_delay += self.typing_realism.get_pause_delay("comma")
-            elif char in '.!?':
-                char_delay += self.typing_realism.get_pause_delay("period")
-            elif char == '\n':
-                char_delay += self.typing_realism.get_pause_delay("newline")
-            elif char in '{}[]()':
-                char_delay += self.typing_realism.get_pause_delay("brace")
-            
-            # Accumulate time until we need to generate a frame
-            accumulated_time += char_delay
-            
-            # Generate frames for the accumulated time
-            frames_to_generate = int(accumulated_time / frame_time)
-            accumulated_time -= frames_to_generate * frame_time
-            
-            # Show the character being typed
-            current_pos += 1
-            frame = self.create_frame(block.code, highlighted_tokens, current_pos)
+    def _generate_realistic_typing_frames(self, out, block: CodeBlock, colored_tokens):
+        """
+        Generate frames with realistic typing timing
+
+        Returns:
+            (position, frame) of the last frame written
+        """
+        if self.typing_realism.randomness == 0:
+            if not self.typing_realism.realistic:
+                return self._generate_uniform_typing_frames(out, block, colored_tokens)
+
+            # Without randomness the delays only depend on the code
+            delays = self._delay_cache.get(block.code)
+            if delays is None:
+                delays = self.typing_realism.get_typing_delays(block.code)
+                self._delay_cache[block.code] = delays
+        else:
+            delays = self.typing_realism.get_typing_delays(block.code)
+
+        frame_counts = _schedule_frames(delays, self.config.fps)
+
+        # Characters typed within the same frame share it, so only render a frame
+        # where the typing crosses into a new one
+        typed = np.flatnonzero(frame_counts)
+        write = out.write
+        current_pos, frame = None, None
+        for current_pos, count in zip((typed + 1).tolist(), frame_counts[typed].tolist()):
+            frame = self.create_frame(block.code, colored_tokens, current_pos)
             
-            # Write the required number of frames
-            for _ in range(max(1, frames_to_generate)):  # Always at least 1 frame
-                out.write(frame)
+            # Write the same buffer for every frame until the next character
+            for _ in range(count):
+                write(frame)
+
+        return current_pos, frame
     
-    def _generate_uniform_typing_frames(self, out, block: CodeBlock, highlighted_tokens):
-        """Generate frames with uniform typing timing (original behavior)"""
+    def _generate_uniform_typing_frames(self, out, block: CodeBlock, colored_tokens):
+        """
+        Generate frames with uniform typing timing (original behavior)
+
+        Returns:
+            (position, frame) of the last frame written
+        """
         total_chars = len(block.code)
         chars_per_frame = self.config.typing_speed / self.config.fps
         total_frames = int(total_chars / chars_per_frame) + 1
 
-        # Generate frames for typing animation
+        # Generate frames for typing animation, rewriting the previous frame
+        # while typing slower than one character per frame
+        write = out.write
+        last_pos, frame = None, None
         for frame_num in range(total_frames):
             current_pos = min(int(frame_num * chars_per_frame), total_chars)
-            frame = self.create_frame(block.code, highlighted_tokens, current_pos)
-            out.write(frame)
+            if current_pos != last_pos:
+                frame = self.create_frame(block.code, colored_tokens, current_pos)
+                last_pos = current_pos
+            write(frame)
+
+        return last_pos, frame
+
+
+def _render_block_to_file(config: VideoConfig, block: CodeBlock, output_path: str,
+                          clear_after: bool, seed) -> str:
+    """Render one code block to its own video file (runs in a worker process)"""
+    generator = CodeToVideoGenerator(config, seed)
+    out = FFmpegWriter(output_path, config.fps, (config.width, config.height))
+    try:
+        generator._write_block(out, block, clear_after)
+    finally:
+        out.release()
+    return output_path
 
 
 def get_available_themes():
     """Get list of available themes for CLI validation"""
-    theme_manager = ThemeManager()
+    theme_manager = _get_theme_manager()
     return theme_manager.list_themes()
 
 
+class LazyChoice(click.ParamType):
+    """Choice parameter whose options are only looked up when a value is given"""
+
+    name = "choice"
+
+    def __init__(self, get_choices, case_sensitive: bool = True):
+        self.get_choices = get_choices
+        self.case_sensitive = case_sensitive
+
+    def convert(self, value, param, ctx):
+        choices = self.get_choices()
+        for choice in choices:
+            if choice == value or (not self.case_sensitive and choice.lower() == value.lower()):
+                return choice
+
+        self.fail(f"{value!r} is not one of {', '.join(map(repr, choices))}.", param, ctx)
+
+
 @click.command()
 @click.argument('input_file', type=click.Path(exists=True), required=False)
 @click.argument('output_file', type=click.Path(), required=False)
@@ -602,8 +1391,9 @@ def get_available_themes():
 @click.option('--font-size', default=16, help='Font size in pixels')
 @click.option('--width', default=1024, help='Video width')
 @click.option('--height', default=768, help='Video height')
-@click.option('--theme', default='dark', type=click.Choice(get_available_themes(), case_sensitive=False),
-              help='Color theme')
+@click.option('--theme', default='dark',
+              type=LazyChoice(get_available_themes, case_sensitive=False),
+              help='Color theme (see --list-themes)')
 @click.option('--pause-duration', default=2.0, help='Pause between code blocks in seconds')
 @click.option('--non-realistic', is_flag=True, 
               help='Disable realistic typing (keyboard difficulty and patterns)')
@@ -616,7 +1406,7 @@ def main(input_file, output_file, typing_speed, font_size, width, height, theme,
 
     # Handle list themes option
     if list_themes:
-        theme_manager = ThemeManager()
+        theme_manager = _get_theme_manager()
         print("🎨 Available Themes:")
         print()
         for theme_name, description in theme_manager.get_theme_info():
@@ -21,6 +21,9 @@ setup(
     url="https://github.com/yourusername/code-to-video",
     py_modules=["code_to_video"],
     install_requires=requirements,
+    extras_require={
+        "fast": ["numba>=0.58.0"],
+    },
     entry_points={
         "console_scripts": [
             "code-to-video=code_to_video:main",
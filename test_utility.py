@@ -3,9 +3,18 @@
 Test script for the code-to-video utility
 """
 
-from code_to_video import CodeToVideoGenerator, VideoConfig
+import atexit
 import os
+import shutil
 import sys
+import tempfile
+
+# Keep the token cache out of the home directory while testing
+_TEST_CACHE_DIR = tempfile.mkdtemp(prefix='code_to_video_test_')
+os.environ['CODE_TO_VIDEO_CACHE_DIR'] = _TEST_CACHE_DIR
+atexit.register(shutil.rmtree, _TEST_CACHE_DIR, ignore_errors=True)
+
+from code_to_video import CodeToVideoGenerator, VideoConfig  # noqa: E402
 
 # Add the current directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -59,6 +68,12 @@ def test_syntax_highlighting():
     assert len(tokens) > 0, "Should have tokens"
     print(f"   Python tokens: {len(tokens)}")
 
+    # Token subtypes take the color of their closest mapped parent
+    token_colors = dict(tokens)
+    assert token_colors['def'] == 'keyword', "Keywords should be highlighted"
+    assert token_colors['hello'] == 'function', "Function names should be highlighted"
+    assert token_colors['Hello!'] == 'string', "String subtypes should be highlighted"
+
     # Test JavaScript highlighting
     js_code = "const x = 42;"
     tokens = highlighter.get_highlighted_text(js_code, 'javascript')
@@ -66,6 +81,27 @@ def test_syntax_highlighting():
     assert len(tokens) > 0, "Should have tokens"
     print(f"   JavaScript tokens: {len(tokens)}")
 
+    # Test lexed code round-trips through the disk cache
+    import code_to_video
+
+    tokenize = code_to_video._tokenize.__wrapped__
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['CODE_TO_VIDEO_CACHE_DIR'] = tmpdir
+        try:
+            lexed = tokenize(js_code, 'javascript')
+            cache_files = [os.path.join(tmpdir, name) for name in os.listdir(tmpdir)]
+            assert cache_files, "Lexed code should be cached on disk"
+            assert tokenize(js_code, 'javascript') == lexed, "Cached tokens should match the lexer's"
+
+            # A malformed entry is lexed again and replaced
+            with open(cache_files[0], 'w') as f:
+                f.write('null')
+            assert tokenize(js_code, 'javascript') == lexed, "Malformed cache should be ignored"
+            with open(cache_files[0]) as f:
+                assert f.read() != 'null', "Malformed cache should be overwritten"
+        finally:
+            os.environ['CODE_TO_VIDEO_CACHE_DIR'] = _TEST_CACHE_DIR
+
     print("✅ Syntax highlighting test passed!")
 
 
@@ -78,11 +114,61 @@ def test_video_generation_dry_run():
 
     # Test frame creation
     tokens = [("print", "keyword"), ("(", "operator"), ("'hello'", "string"), (")", "operator")]
+    tokens = generator.highlighter.resolve_colors(tokens)
+    assert tokens[0] == ("print", config.theme.colors['keyword']), "Should resolve token colors"
     frame = generator.create_frame("print('hello')", tokens, 5)
 
     assert frame is not None, "Frame should be created"
     assert frame.shape == (480, 640, 3), f"Expected (480, 640, 3), got {frame.shape}"
 
+    # Typing forward draws incrementally, but must match a fresh render
+    generator.create_frame("print('hello')", tokens, 2)
+    incremental = generator.create_frame("print('hello')", tokens, 9).copy()
+    generator.reset_canvas()
+    fresh = generator.create_frame("print('hello')", tokens, 9)
+    assert (incremental == fresh).all(), "Incremental frame should match a fresh render"
+
+    # Going back redraws from cached lines, but must also match a fresh render
+    code = "x = 1\ny = 2\nz = 3"
+    lines = generator.highlighter.resolve_colors([(code, "default")])
+    generator.create_frame(code, lines, len(code))
+    rewound = generator.create_frame(code, lines, 9).copy()
+    generator.reset_canvas()
+    fresh = generator.create_frame(code, lines, 9)
+    assert (rewound == fresh).all(), "Rewound frame should match a fresh render"
+
+    # Glyphs blended one by one match the compiled paste used with numba
+    block_code = "def greet(name):\n    # Say hi\n    return f'Hi {name}!' * 3"
+    block_tokens = generator.highlighter.resolve_colors(
+        generator.highlighter.get_highlighted_text(block_code, 'python'))
+    generator.reset_canvas()
+    pasted = generator.create_frame(block_code, block_tokens, len(block_code)).copy()
+    generator.reset_canvas()
+    generator.create_frame(block_code, block_tokens, 0)
+    generator._glyph_tensor = None
+    blended = generator.create_frame(block_code, block_tokens, len(block_code))
+    assert (pasted == blended).all(), "Per-glyph blending should match the compiled paste"
+
+    # The threaded writer keeps frame order and copies the reused frame buffer
+    from code_to_video import ThreadedWriter
+
+    class FrameList(list):
+        def write(self, frame):
+            self.append(frame.copy())
+
+        def release(self):
+            pass
+
+    written = FrameList()
+    writer = ThreadedWriter(written, maxsize=2)
+    for pos in range(len(code) + 1):
+        writer.write(generator.create_frame(code, lines, pos))
+    writer.release()
+    generator.reset_canvas()
+    assert len(written) == len(code) + 1, "Threaded writer should write every frame"
+    assert all((frame == generator.create_frame(code, lines, pos)).all()
+               for pos, frame in enumerate(written)), "Threaded writer should keep frames intact"
+
     print("✅ Video generation setup test passed!")
 
 
@@ -108,6 +194,20 @@ def test_indentation_handling():
     indent_width2 = generator._calculate_indentation_width(test_text, second_newline)
     assert indent_width2 > indent_width, "Should detect deeper indentation"
 
+    # Test indentation is precomputed for every line start
+    indent_map = generator._build_indent_map(test_text)
+    assert indent_map == {first_newline: indent_width, second_newline: indent_width2}, \
+        "Indent map should match per-line calculation"
+
+    # Test the block layout indents each line and ends with the cursor position
+    layout = generator._layout_block(test_text, [(test_text[:2], (255, 255, 255)),
+                                                 (test_text[2:], (0, 0, 0))])
+    assert len(layout.xs) == len(test_text) + 1, "Layout should cover every cursor position"
+    assert layout.xs[first_newline] == 20 + indent_width, "Line should start after its indent"
+    assert layout.lines[second_newline] == 2, "Layout should count lines"
+    assert len(set(layout.color_ids[:2])) == 1 and layout.color_ids[1] != layout.color_ids[2], \
+        "Layout should give each token's characters its palette index"
+
     print("✅ Indentation handling test passed!")
 
 
@@ -132,10 +232,52 @@ def test_theme_system():
     assert hasattr(dark_theme, 'background'), "Theme should have background"
     assert hasattr(dark_theme, 'cursor'), "Theme should have cursor color"
 
+    # Test the color LUT rows follow the color index
+    for key, row in dark_theme.color_index.items():
+        assert tuple(dark_theme.color_lut[row]) == dark_theme.colors[key], \
+            f"Color LUT row for '{key}' should match the theme color"
+
+    # Test a malformed theme is skipped without breaking the others
+    import json
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shutil.copy(os.path.join('themes', 'dark.json'), tmpdir)
+        with open(os.path.join('themes', 'dark.json')) as f:
+            bad_theme = json.load(f)
+        bad_theme['colors']['keyword'] = [300, 0, 0, 255]
+        with open(os.path.join(tmpdir, 'bad.json'), 'w') as f:
+            json.dump(bad_theme, f)
+
+        themes_with_bad = ThemeManager(tmpdir).list_themes()
+        assert themes_with_bad == ['dark'], f"Expected only 'dark', got {themes_with_bad}"
+
+    # Test the shared theme manager is only loaded once
+    from code_to_video import _get_theme_manager
+    assert _get_theme_manager() is _get_theme_manager(), "Theme manager should be shared"
+
     print(f"   Found {len(themes)} themes: {', '.join(themes)}")
     print("✅ Theme system test passed!")
 
 
+def test_cli_theme_option():
+    """Test the CLI validates themes without loading them at import time"""
+    print("🧪 Testing CLI theme option...")
+
+    from click.testing import CliRunner
+    from code_to_video import main
+
+    runner = CliRunner()
+
+    result = runner.invoke(main, ['--list-themes'])
+    assert result.exit_code == 0, f"--list-themes failed: {result.output}"
+    assert 'dark' in result.output, "Should list the dark theme"
+
+    result = runner.invoke(main, ['--theme', 'no-such-theme', '--list-themes'])
+    assert result.exit_code != 0, "Unknown themes should be rejected"
+
+    print("✅ CLI theme option test passed!")
+
+
 def test_realistic_typing():
     """Test realistic typing system"""
     print("🧪 Testing realistic typing system...")
@@ -183,10 +325,81 @@ def test_realistic_typing():
     realistic_delay_2 = realistic_no_random.get_character_delay('a', "", 0)
     assert abs(realistic_delay_1 - realistic_delay_2) < 0.001, "No randomness should give consistent delays"
     print(f"   Realistic no-random 'a': {realistic_delay_1:.3f}s")
+
+    # Test vectorized delays match the per-character calculation
+    code = "ab1!\nx"
+    delays = realistic_no_random.get_typing_delays(code)
+    assert delays.shape == (len(code),), "Should have one delay per character"
+    expected = realistic_no_random.get_character_delay('1', code, 2)
+    assert abs(delays[2] - expected) < 0.001, "Vectorized delay should match scalar delay"
+    newline_delay = (realistic_no_random.get_character_delay('\n', code, 4)
+                     + realistic_no_random.get_pause_delay("newline"))
+    assert abs(delays[4] - newline_delay) < 0.001, "Vectorized delay should include pauses"
+
+    # Test seeded random variation is reproducible
+    seeded_a = TypingRealism(base_speed=30.0, realistic=True, randomness=1.0, seed=7)
+    seeded_b = TypingRealism(base_speed=30.0, realistic=True, randomness=1.0, seed=7)
+    assert (seeded_a.get_typing_delays(code) == seeded_b.get_typing_delays(code)).all(), \
+        "Same seed should give the same delays"
+    assert seeded_a.precompute_noise(5).shape == (5,), "Should draw one value per character"
+
+    # Test pattern multipliers found in one scan match the per-position check
+    code = "/* TODO */ def f(): return console.log('')"
+    fast_mult, slow_mult = realistic_no_random.precompute_multipliers(code)
+    assert fast_mult[15] == 0.6, "'def ' should speed up nearby characters"
+    assert slow_mult[0] == 1.4, "'TODO' should slow down nearby characters"
+    for position in range(len(code)):
+        combined = slow_mult[position] if slow_mult[position] > 1.0 else fast_mult[position]
+        expected = realistic_no_random._get_pattern_multiplier(code, position)
+        assert combined == expected, f"Pattern multiplier mismatch at {position}"
+
+    # Test the frame schedule in use (compiled when numba is installed) matches NumPy's
+    import numpy as np
+    from code_to_video import _schedule_frames, _schedule_frames_numpy
+
+    rng = np.random.default_rng(0)
+    for fps in (24, 30, 60):
+        # Random delays, and delays landing exactly on frame boundaries
+        for delays in (rng.exponential(0.05, 500), np.full(500, 1 / fps)):
+            assert (_schedule_frames(delays, fps) == _schedule_frames_numpy(delays, fps)).all(), \
+                f"Frame schedules should match at {fps} fps"
     
     print("✅ Realistic typing test passed!")
 
 
+def test_parallel_block_seeding():
+    """Test parallel block rendering is reproducible when seeded"""
+    print("🧪 Testing parallel block seeding...")
+
+    import hashlib
+
+    class FrameHashes(list):
+        def write(self, frame):
+            self.append(hashlib.md5(frame.tobytes()).hexdigest())
+
+    config = VideoConfig(width=320, height=240, typing_speed=60, pause_duration=0.1)
+    code = "```python\nx = 1\nprint(x)\n```\n\n```javascript\nlet y = 2;\n```"
+
+    def render_blocks(seed):
+        # Render each block the way a worker process would
+        generator = CodeToVideoGenerator(config, seed=seed)
+        blocks = generator.parse_markdown(code)
+        runs = []
+        for i, (block, block_seed) in enumerate(zip(blocks, generator._block_seeds(len(blocks)))):
+            frames = FrameHashes()
+            CodeToVideoGenerator(config, block_seed)._write_block(frames, block, i == 0)
+            runs.append(frames)
+        return runs
+
+    assert render_blocks(3) == render_blocks(3), "Seeded parallel blocks should be reproducible"
+
+    unseeded = CodeToVideoGenerator(config)
+    assert unseeded._block_seeds(1)[0].entropy != unseeded._block_seeds(1)[0].entropy, \
+        "Unseeded parallel blocks should draw fresh randomness"
+
+    print("✅ Parallel block seeding test passed!")
+
+
 def main():
     """Run all tests"""
     print("🚀 Running code-to-video utility tests...\n")
@@ -197,7 +410,9 @@ def main():
         test_video_generation_dry_run()
         test_indentation_handling()
         test_theme_system()
+        test_cli_theme_option()
         test_realistic_typing()
+        test_parallel_block_seeding()
 
         print("\n🎉 All tests passed! The utility is ready to use.")
         print("\nTo generate a video from the example file, run:")